@@ -5,11 +5,15 @@ Dark-theme dashboard – Schneider Electric palette
 """
 
 from flask import Flask, render_template, request, send_file
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import plotly.graph_objects as go
-import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
+from collections import OrderedDict
+import hashlib
 import io
-import tempfile
+import threading
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16 MB
@@ -18,11 +22,17 @@ app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16 MB
 # CONSTANTS
 # ──────────────────────────────────────────────────────────────────
 ID_COLS   = ["Cluster", "Employee Responsible", "Helios Code"]
+SHEET_COLS = {"Employee Responsible", "Helios Code", "MINR-2025"}   # all we read
 PIV1_DEC  = 2
 EMP_SCALE = 1          # rupees → millions  (set to 1 ⇒ no scaling)
 EMP_DEC   = 2
 TOTAL_HDR = "Total (mn)"
 
+# Rust-based reader – much faster than openpyxl for large sheets
+EXCEL_ENGINE = "calamine"
+# text ID columns read straight into the string dtype (ignored if absent)
+ID_DTYPES = {"Employee Responsible": "string", "Helios Code": "string"}
+
 # Schneider-Electric colours
 SE_GREEN  = "#00B140"
 LIGHT_GRN = "#6AFFB4"
@@ -46,16 +56,98 @@ EMPLOYEE_CLUSTER_MAP = {
 
 DEFAULT_CLUSTER = "OD"
 
+# (key, cluster) pairs tried in this order, longest key first, so when a
+# name contains several keys the most specific one wins (e.g. "Harsh
+# Priyanka Auddy" → JSR, not B+R); equal lengths keep the map's order
+_EMP_PAIRS = tuple(sorted(EMPLOYEE_CLUSTER_MAP.items(), key=lambda kv: -len(kv[0])))
+
+# Helios-code prefix → BU
+BU_PREFIX_MAP = {
+    "PP": "PP", "HD": "H&D", "ID": "IND",
+    "SP": "SP", "PS": "SP",
+    "DP": "DE", "DE": "DE",
+}
+DEFAULT_BU = "Other"
+
 TABLE_CLASS = "table table-bordered table-hover display nowrap"
 
+# plotly.js bundle matching the installed plotly, loaded once per page
+PLOTLY_JS_URL = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+PLOTLY_CONFIG = {"displaylogo": False, "responsive": True}
+
+DASHBOARD_CACHE_SIZE = 16  # rendered /upload pages kept in memory
+TEMPLATE_CACHE_SIZE = 32   # generated target templates kept in memory
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 # ──────────────────────────────────────────────────────────────────
 # HELPERS
 # ──────────────────────────────────────────────────────────────────
-def plot_div(fig, height=400):
-    return pio.to_html(
-        fig, full_html=False, include_plotlyjs="cdn",
-        config={"displaylogo": False}, default_height=height
-    )
+def plot_json(fig, height=400):
+    # rendered client-side by Plotly.newPlot in result.html; <, > and & are
+    # escaped so the JSON can sit directly inside a <script> block
+    fig.update_layout(height=height)
+    return (fig.to_json().replace("<", "\\u003c")
+            .replace(">", "\\u003e").replace("&", "\\u0026"))
+
+def stream_digest(stream):
+    """blake2b of an upload, read in chunks; the stream is rewound afterwards."""
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(1 << 16), b""):
+        h.update(chunk)
+    stream.seek(0)
+    return h.digest()
+
+def lru_lookup(cache, lock, key, build, maxsize, cacheable=None):
+    """Return cache[key], calling build() on a miss; drops the oldest entry past maxsize.
+
+    Values failing cacheable(value) (e.g. error responses) are returned but not stored.
+    """
+    with lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = build()
+    if cacheable is not None and not cacheable(value):
+        return value
+    with lock:
+        cache[key] = value
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+    return value
+
+def read_sheet(stream):
+    # headers are stripped only after the read, so match them padded too
+    return pd.read_excel(stream, sheet_name=0, engine=EXCEL_ENGINE, dtype=ID_DTYPES,
+                         usecols=lambda col: str(col).strip() in SHEET_COLS)
+
+def read_targets(stream):
+    """Employee and BU target dicts from a filled-in target template."""
+    # Read both sheets of the template in one pass over the workbook
+    with pd.ExcelFile(stream, engine=EXCEL_ENGINE) as xls:
+        sheets = pd.read_excel(xls, sheet_name=["Employee Targets", "BU Targets"])
+    emp_targets_df, bu_targets_df = sheets["Employee Targets"], sheets["BU Targets"]
+    # Validate and clean target values
+    emp_targets_df["Target"] = pd.to_numeric(emp_targets_df["Target"], errors="coerce")
+    bu_targets_df["Target"] = pd.to_numeric(bu_targets_df["Target"], errors="coerce")
+    # Create dictionaries for easy lookup, filling NaNs with 0
+    emp_targets = emp_targets_df.set_index("Employee Responsible")["Target"].fillna(0).to_dict()
+    bu_targets = bu_targets_df.set_index("BU")["Target"].fillna(0).to_dict()
+    return emp_targets, bu_targets
+
+def pair_sums(df, col, n_emp, n_pairs):
+    """Sum df[col] per (Cluster, Employee Responsible) code pair.
+
+    Returns the sums and a mask of the pair ids that occur at all; rows with
+    a missing employee are skipped and NaN values count as 0, as in groupby.
+    """
+    cl = df["Cluster"].cat.codes.to_numpy()
+    emp = df["Employee Responsible"].cat.codes.to_numpy()
+    ok = (cl >= 0) & (emp >= 0)
+    ids = cl[ok].astype(np.int64) * n_emp + emp[ok]
+    vals = np.nan_to_num(df[col].to_numpy()[ok])
+    sums = np.bincount(ids, weights=vals, minlength=n_pairs)
+    seen = np.bincount(ids, minlength=n_pairs) > 0
+    return sums, seen
 
 def dark_template(fig):
     fig.update_layout(template="plotly_dark",
@@ -71,6 +163,9 @@ def index():
     return render_template("index.html")
 
 
+_dashboard_cache = OrderedDict()     # blake2b(uploads) → rendered result page
+_dashboard_lock = threading.Lock()
+
 @app.route("/upload", methods=["POST"])
 def upload():
     # 1. read Excel files
@@ -85,31 +180,39 @@ def upload():
     if not targets_file or targets_file.filename == "":
         return "⚠️ No targets file selected.", 400
 
+    # the page is a pure function of the three uploads → memoise by content
+    streams = (sales_file.stream, ob_file.stream, targets_file.stream)
+    key = hashlib.blake2b(b"".join(map(stream_digest, streams)), digest_size=16).digest()
+    # only rendered pages are kept – (message, 400) error tuples are rebuilt
+    # every time, so a transient read failure isn't pinned to these files
+    return lru_lookup(_dashboard_cache, _dashboard_lock, key,
+                      lambda: build_dashboard(*streams), DASHBOARD_CACHE_SIZE,
+                      cacheable=lambda page: isinstance(page, str))
+
+
+def build_dashboard(sales_stream, ob_stream, targets_stream):
     try:
-        df_sales = pd.read_excel(io.BytesIO(sales_file.read()), sheet_name=0)
-        df_ob = pd.read_excel(io.BytesIO(ob_file.read()), sheet_name=0)
-        # Read targets from the template using pd.ExcelFile to read multiple sheets
-        with pd.ExcelFile(targets_file) as xls:
-            emp_targets_df = pd.read_excel(xls, sheet_name="Employee Targets")
-            bu_targets_df = pd.read_excel(xls, sheet_name="BU Targets")
-        # Validate and clean target values
-        emp_targets_df["Target"] = pd.to_numeric(emp_targets_df["Target"], errors="coerce")
-        bu_targets_df["Target"] = pd.to_numeric(bu_targets_df["Target"], errors="coerce")
-        # Create dictionaries for easy lookup, filling NaNs with 0
-        emp_targets = emp_targets_df.set_index("Employee Responsible")["Target"].fillna(0).to_dict()
-        bu_targets = bu_targets_df.set_index("BU")["Target"].fillna(0).to_dict()
+        df_sales = read_sheet(sales_stream)
+        df_ob = read_sheet(ob_stream)
+        emp_targets, bu_targets = read_targets(targets_stream)
     except Exception as exc:
         return f"⚠️ Could not read Excel – {exc}", 400
 
     for df in [df_sales, df_ob]:
         df.columns = df.columns.str.strip()
-        def get_cluster(employee_name_from_file):
-            if isinstance(employee_name_from_file, str):
-                for map_key, cluster in EMPLOYEE_CLUSTER_MAP.items():
-                    if map_key in employee_name_from_file:
-                        return cluster
-            return DEFAULT_CLUSTER
-        df['Cluster'] = df['Employee Responsible'].apply(get_cluster)
+        # match each distinct name once, then broadcast back to the rows;
+        # the first of _EMP_PAIRS found anywhere in the name decides the cluster
+        names = df['Employee Responsible'].astype('string')
+        uniq = pd.Series(names.dropna().unique(), dtype='string')
+        uniq_cluster = pd.Series(DEFAULT_CLUSTER, index=uniq.index, dtype=object)
+        unmatched = pd.Series(True, index=uniq.index)
+        for map_key, cluster in _EMP_PAIRS:
+            hit = unmatched & uniq.str.contains(map_key, regex=False)
+            uniq_cluster[hit] = cluster
+            unmatched &= ~hit
+        cluster_of = pd.Series(uniq_cluster.to_numpy(), index=uniq, dtype='string')
+        # dtype pinned: on an empty sheet map() would otherwise give float64
+        df['Cluster'] = names.map(cluster_of).fillna(DEFAULT_CLUSTER).astype('string')
 
     missing = [c for c in ID_COLS if c not in df_sales.columns]
     if missing:
@@ -128,139 +231,143 @@ def upload():
     sales_col = "MINR-2025"
     ob_col = "MINR-2025"
     # ────────────────────────────────
+    # plain float64 values – no object columns reaching the aggregations
+    # (float32 would lose the paise on crore-sized totals while EMP_SCALE == 1)
+    df_sales[sales_col] = pd.to_numeric(df_sales[sales_col], errors="coerce").astype("float64")
+    df_ob[ob_col] = pd.to_numeric(df_ob[ob_col], errors="coerce").astype("float64")
+
+    for df in [df_sales, df_ob]:
+        prefix = df["Helios Code"].astype("string").str.slice(0, 2)
+        df["BU"] = prefix.map(BU_PREFIX_MAP).fillna(DEFAULT_BU)
+    # Categorical keys → groupby/pivot work on small int codes, not strings.
+    # Both sheets share one sorted category set so their codes line up; each
+    # key is cast to "string" first so the two category dtypes always agree
+    # (an empty sheet would otherwise bring float64 categories).
+    for c in ("Cluster", "Employee Responsible", "BU"):
+        cats = union_categoricals(
+            [df_sales[c].astype("string").astype("category"),
+             df_ob[c].astype("string").astype("category")],
+            sort_categories=True,
+        ).categories
+        df_sales[c] = df_sales[c].astype(pd.CategoricalDtype(cats))
+        df_ob[c] = df_ob[c].astype(pd.CategoricalDtype(cats))
 
     # ───────────────────────────────────────────────────────────────
     # PIVOT-2  (Employee totals & KPIs)
     # ───────────────────────────────────────────────────────────────
-    # Group by cluster/employee for both sales and OB
-    grp_sales = (
-        df_sales.groupby(["Cluster", "Employee Responsible"])[sales_col]
-        .sum()
-        .reset_index()
+    # Per-employee sums straight off the shared categorical codes: each
+    # (Cluster, Employee) pair gets one flat id and np.bincount sums by it.
+    # Pairs present in only one sheet get 0 for the other, like an outer merge.
+    cl_cats = df_sales["Cluster"].cat.categories
+    emp_cats = df_sales["Employee Responsible"].cat.categories
+    n_pairs = len(cl_cats) * len(emp_cats)
+    ob_sums, ob_seen = pair_sums(df_ob, ob_col, len(emp_cats), n_pairs)
+    sales_sums, sales_seen = pair_sums(df_sales, sales_col, len(emp_cats), n_pairs)
+    pair_ids = np.flatnonzero(ob_seen | sales_seen)
+    merged = pd.DataFrame({
+        "Cluster": cl_cats[pair_ids // len(emp_cats)],
+        "Employee Responsible": emp_cats[pair_ids % len(emp_cats)],
+        "ob": ob_sums[pair_ids],
+        "sales": sales_sums[pair_ids],
+    })
+
+    # Employee rows – column math over the whole merged frame at once
+    name_tgt = merged["Employee Responsible"].map(emp_targets)
+    emp_tgt = name_tgt.fillna(0)
+    emp_tgt_mn = (emp_tgt / EMP_SCALE).round(EMP_DEC).where(emp_tgt > 0, 0)
+    has_tgt = emp_tgt_mn > 0
+    emp_rows_df = merged[["Cluster", "Employee Responsible"]].copy()
+    for label, col in (("OB", "ob"), ("Sales", "sales")):
+        total_mn = (merged[col] / EMP_SCALE).round(EMP_DEC)
+        emp_rows_df[f"{label} Total (mn)"] = total_mn
+        emp_rows_df[f"{label} Remaining"] = (emp_tgt_mn - total_mn).round(EMP_DEC).where(has_tgt, 0)
+        emp_rows_df[f"{label} Achiev %"] = (total_mn / emp_tgt_mn * 100).round(2).where(has_tgt, 0)
+    emp_rows_df["Target"] = emp_tgt_mn
+
+    # Cluster subtotals – a cluster-level target wins, else the sum of its employees'
+    cluster_sums = (
+        merged.assign(name_tgt=name_tgt)
+        .groupby("Cluster", sort=False)[["ob", "sales", "name_tgt"]]
+        .sum(min_count=1)
     )
-    grp_ob = (
-        df_ob.groupby(["Cluster", "Employee Responsible"])[ob_col]
-        .sum()
-        .reset_index()
+    cl_names = cluster_sums.index.to_series()
+    cl_target = cl_names.map(emp_targets).fillna(cluster_sums["name_tgt"]).round(EMP_DEC)
+    cl_target_mn = (cl_target / EMP_SCALE).round(EMP_DEC)
+    cluster_rows_df = pd.DataFrame({
+        "Cluster": cl_names, "Employee Responsible": cl_names + " Total",
+    })
+    for label, col in (("OB", "ob"), ("Sales", "sales")):
+        total_mn = (cluster_sums[col] / EMP_SCALE).round(EMP_DEC)
+        cluster_rows_df[f"{label} Total (mn)"] = total_mn
+        cluster_rows_df[f"{label} Remaining"] = (cl_target_mn - total_mn).round(EMP_DEC)
+        cluster_rows_df[f"{label} Achiev %"] = (total_mn / cl_target_mn * 100).round(2).where(cl_target_mn != 0)
+    cluster_rows_df["Target"] = cl_target_mn
+    cluster_rows_df = cluster_rows_df.reset_index(drop=True)
+
+    # Interleave: each subtotal row followed by that cluster's employees
+    pivot2 = (
+        pd.concat([cluster_rows_df, emp_rows_df], ignore_index=True)
+        .sort_values("Cluster", kind="stable")
+        .reset_index(drop=True)
     )
-    # Merge sales and OB on Cluster + Employee
-    merged = pd.merge(grp_ob, grp_sales, on=["Cluster", "Employee Responsible"], how="outer", suffixes=("_ob", "_sales")).fillna(0)
-
-    rows, cluster_rows, emp_rows = [], [], []
-    for clust, sub in merged.groupby("Cluster", sort=False):
-        subtotal_ob = sub[ob_col + "_ob"].sum()
-        subtotal_sales = sub[sales_col + "_sales"].sum()
-        total_ob_mn = round(subtotal_ob / EMP_SCALE, EMP_DEC)
-        total_sales_mn = round(subtotal_sales / EMP_SCALE, EMP_DEC)
-        cl_target = emp_targets.get(
-            clust, sub["Employee Responsible"].map(emp_targets).sum(min_count=1)
-        )
-        cl_target = round(cl_target, EMP_DEC) if cl_target is not None else None
-        cl_target_mn = round(cl_target / EMP_SCALE, EMP_DEC) if cl_target is not None else None
-        remaining_ob_mn = round(cl_target_mn - total_ob_mn, EMP_DEC) if cl_target_mn is not None else None
-        remaining_sales_mn = round(cl_target_mn - total_sales_mn, EMP_DEC) if cl_target_mn is not None else None
-        achv_ob_pct = round(total_ob_mn / cl_target_mn * 100, 2) if cl_target_mn else None
-        achv_sales_pct = round(total_sales_mn / cl_target_mn * 100, 2) if cl_target_mn else None
-        subtotal_row = {
-            "Cluster": clust, "Employee Responsible": f"{clust} Total",
-            "OB Total (mn)": total_ob_mn, "OB Remaining": remaining_ob_mn, "OB Achiev %": achv_ob_pct,
-            "Sales Total (mn)": total_sales_mn, "Sales Remaining": remaining_sales_mn, "Sales Achiev %": achv_sales_pct,
-            "Target": cl_target_mn
-        }
-        rows.append(subtotal_row)
-        cluster_rows.append(subtotal_row)
-        for _, r in sub.iterrows():
-            name = r["Employee Responsible"]
-            tgt = emp_targets.get(name, 0)
-            tgt_mn = round(tgt / EMP_SCALE, EMP_DEC) if tgt > 0 else 0
-            ob_total = round(r[ob_col + "_ob"] / EMP_SCALE, EMP_DEC)
-            sales_total = round(r[sales_col + "_sales"] / EMP_SCALE, EMP_DEC)
-            ob_rem = round(tgt_mn - ob_total, EMP_DEC) if tgt_mn > 0 else 0
-            sales_rem = round(tgt_mn - sales_total, EMP_DEC) if tgt_mn > 0 else 0
-            ob_ach = round((ob_total / tgt_mn * 100), 2) if tgt_mn > 0 else 0
-            sales_ach = round((sales_total / tgt_mn * 100), 2) if tgt_mn > 0 else 0
-            emp_row = {
-                "Name": name,
-                "OB Total (mn)": ob_total, "OB Remaining": ob_rem, "OB Achiev %": ob_ach,
-                "Sales Total (mn)": sales_total, "Sales Remaining": sales_rem, "Sales Achiev %": sales_ach,
-                "Target": tgt_mn
-            }
-            emp_rows.append(emp_row)
-            rows.append({"Cluster": clust, "Employee Responsible": name, **emp_row | {}})
-    pivot2 = pd.DataFrame(rows)
-    pivot2.drop(columns=['Name'], inplace=True, errors='ignore')
-    def highlight_subtotal_row(row):
-        is_subtotal = 'Total' in str(row['Employee Responsible'])
-        return ['background-color: #00582B'] * len(row) if is_subtotal else [''] * len(row)
-    styler = pivot2.style.apply(highlight_subtotal_row, axis=1).format({
+    # subtotal mask computed once; styles built for the whole table in one broadcast
+    is_subtotal = pivot2["Employee Responsible"].astype(str).str.contains("Total", regex=False).to_numpy()
+    def highlight_subtotal_rows(df):
+        css = np.where(is_subtotal[:, None], 'background-color: #00582B', '')
+        return pd.DataFrame(np.broadcast_to(css, df.shape), index=df.index, columns=df.columns)
+    styler = pivot2.style.apply(highlight_subtotal_rows, axis=None).format({
         "OB Total (mn)": '{:,.2f}', "OB Remaining": '{:,.2f}', "OB Achiev %": '{:.2f}',
         "Sales Total (mn)": '{:,.2f}', "Sales Remaining": '{:,.2f}', "Sales Achiev %": '{:.2f}',
         'Target': '{:,.2f}'
-    })
-    pivot2_html = styler.to_html(classes=TABLE_CLASS, index=False, border=0, na_rep="")
+    }, na_rep="")
+    # Styler.to_html takes no classes/index/na_rep kwargs – set them on the Styler
+    pivot2_html = (styler.set_table_attributes(f'class="{TABLE_CLASS}"')
+                   .hide(axis="index").to_html())
 
     # ───────────────────────────────────────────────────────────────
     # BU Wise Performance Table
     # ───────────────────────────────────────────────────────────────
-    def get_bu_from_helios(helios_code):
-        if isinstance(helios_code, str):
-            if helios_code.startswith("PP"):
-                return "PP"
-            elif helios_code.startswith("HD"):
-                return "H&D"
-            elif helios_code.startswith("ID"):
-                return "IND"
-            elif helios_code.startswith("SP") or helios_code.startswith("PS"):
-                return "SP"
-            elif helios_code.startswith("DP") or helios_code.startswith("DE"):
-                return "DE"
-        return "Other"
-    df_sales["BU"] = df_sales["Helios Code"].apply(get_bu_from_helios)
-    df_ob["BU"] = df_ob["Helios Code"].apply(get_bu_from_helios)
-    bu_sales_df = df_sales.groupby("BU", as_index=False)[sales_col].sum()
+    bu_sales_df = df_sales.groupby("BU", observed=True, as_index=False)[sales_col].sum()
     bu_sales_df.rename(columns={sales_col: "Sales"}, inplace=True)
-    bu_ob_df = df_ob.groupby("BU", as_index=False)[ob_col].sum()
+    bu_ob_df = df_ob.groupby("BU", observed=True, as_index=False)[ob_col].sum()
     bu_ob_df.rename(columns={ob_col: "OB"}, inplace=True)
-    bu_performance_rows = []
-    for bu_name, bu_target in bu_targets.items():
-        sales_row = bu_sales_df[bu_sales_df["BU"] == bu_name]
-        ob_row = bu_ob_df[bu_ob_df["BU"] == bu_name]
-        sales = sales_row["Sales"].iloc[0] if not sales_row.empty else 0
-        ob = ob_row["OB"].iloc[0] if not ob_row.empty else 0
-        remaining_sales = bu_target - sales
-        remaining_ob = bu_target - ob
-        ach_sales = f"{round(sales / bu_target * 100, 2)}%" if bu_target else "0.00%"
-        ach_ob = f"{round(ob / bu_target * 100, 2)}%" if bu_target else "0.00%"
-        sales_mn = round(sales / EMP_SCALE, EMP_DEC)
-        ob_mn = round(ob / EMP_SCALE, EMP_DEC)
-        bu_target_mn = round(bu_target / EMP_SCALE, EMP_DEC)
-        remaining_sales_mn = round(remaining_sales / EMP_SCALE, EMP_DEC)
-        remaining_ob_mn = round(remaining_ob / EMP_SCALE, EMP_DEC)
-        bu_performance_rows.append({
-            "BU": bu_name,
-            "OB (mn)": ob_mn,
-            "OB Remaining (mn)": remaining_ob_mn,
-            "ACH OB (%)": ach_ob,
-            "Sales (mn)": sales_mn,
-            "Sales Remaining (mn)": remaining_sales_mn,
-            "ACH Sales (%)": ach_sales,
-            "Target (mn)": bu_target_mn
-        })
-    bu_df = pd.DataFrame(bu_performance_rows)
+    # One row per BU target; actuals looked up by BU instead of masked per row
+    sales_map = bu_sales_df.set_index("BU")["Sales"]
+    ob_map = bu_ob_df.set_index("BU")["OB"]
+    bu_perf = pd.DataFrame({"BU": list(bu_targets), "Target": list(bu_targets.values())})
+    bu_perf["Sales"] = bu_perf["BU"].map(sales_map).fillna(0)
+    bu_perf["OB"] = bu_perf["BU"].map(ob_map).fillna(0)
+    has_bu_tgt = bu_perf["Target"] != 0
+
+    def ach_pct(actual):
+        pct = (actual / bu_perf["Target"] * 100).round(2).astype(str) + "%"
+        return pct.where(has_bu_tgt, "0.00%")
+
+    bu_df = pd.DataFrame({
+        "BU": bu_perf["BU"],
+        "OB (mn)": (bu_perf["OB"] / EMP_SCALE).round(EMP_DEC),
+        "OB Remaining (mn)": ((bu_perf["Target"] - bu_perf["OB"]) / EMP_SCALE).round(EMP_DEC),
+        "ACH OB (%)": ach_pct(bu_perf["OB"]),
+        "Sales (mn)": (bu_perf["Sales"] / EMP_SCALE).round(EMP_DEC),
+        "Sales Remaining (mn)": ((bu_perf["Target"] - bu_perf["Sales"]) / EMP_SCALE).round(EMP_DEC),
+        "ACH Sales (%)": ach_pct(bu_perf["Sales"]),
+        "Target (mn)": (bu_perf["Target"] / EMP_SCALE).round(EMP_DEC),
+    })
     bu_table_html = bu_df.style.format({
         "OB (mn)": '{:,.2f}', "OB Remaining (mn)": '{:,.2f}', "ACH OB (%)": '{}',
         "Sales (mn)": '{:,.2f}', "Sales Remaining (mn)": '{:,.2f}', "ACH Sales (%)": '{}',
         "Target (mn)": '{:,.2f}'
-    }).to_html(classes=TABLE_CLASS, index=False, border=0, na_rep="")
+    }, na_rep="").set_table_attributes(f'class="{TABLE_CLASS}"').hide(axis="index").to_html()
 
     # ─── Dashboard charts (6 graphs) ────────────────────────────────
     # Use only sales data for charts
-    clusters  = [r["Cluster"] for r in cluster_rows]
-    totals    = [r["Sales Total (mn)"] for r in cluster_rows]
-    targets   = [r["Target"]  for r in cluster_rows]
-    remain    = [r["Sales Remaining"] for r in cluster_rows]
-    achv_pct  = [r["Sales Achiev %"]  for r in cluster_rows]
-    dash_divs = []
+    clusters  = cluster_rows_df["Cluster"].tolist()
+    totals    = cluster_rows_df["Sales Total (mn)"].tolist()
+    targets   = cluster_rows_df["Target"].tolist()
+    remain    = cluster_rows_df["Sales Remaining"].tolist()
+    achv_pct  = cluster_rows_df["Sales Achiev %"].astype(object)
+    achv_pct  = achv_pct.where(achv_pct.notna(), None).tolist()   # NaN → blank label
+    dash_figs = []
     # 1. Totals vs Targets
     fig1 = go.Figure([
         go.Bar(name="Total (mn)", x=clusters, y=totals,  marker_color=SE_GREEN),
@@ -269,7 +376,7 @@ def upload():
     dark_template(fig1).update_layout(
         barmode="group", title="Cluster Total vs Target", legend_title_text=""
     )
-    dash_divs.append(plot_div(fig1))
+    dash_figs.append(plot_json(fig1))
     # 2. Achievement %
     fig2 = go.Figure(go.Bar(
         x=clusters, y=achv_pct, text=achv_pct, textposition="outside",
@@ -277,7 +384,7 @@ def upload():
     ))
     dark_template(fig2).update_layout(title="Achievement %", yaxis_title="%",
                                       xaxis_tickangle=-15)
-    dash_divs.append(plot_div(fig2))
+    dash_figs.append(plot_json(fig2))
     # 3. Remaining to Target
     fig3 = go.Figure([
         go.Bar(name="Achieved",  x=clusters, y=totals,  marker_color=SE_GREEN),
@@ -286,7 +393,7 @@ def upload():
     dark_template(fig3).update_layout(
         barmode="stack", title="Remaining to Target", legend_title_text=""
     )
-    dash_divs.append(plot_div(fig3))
+    dash_figs.append(plot_json(fig3))
     # 4. Pie share of totals
     fig4 = go.Figure(go.Pie(
         labels=clusters, values=totals,
@@ -294,7 +401,7 @@ def upload():
         hole=0.4
     ))
     dark_template(fig4).update_layout(title="Share of Total Sales (mn)")
-    dash_divs.append(plot_div(fig4, height=380))
+    dash_figs.append(plot_json(fig4, height=380))
     # 5. Scatter Target vs Achievement %
     fig5 = go.Figure(go.Scatter(
         x=targets, y=achv_pct, mode="markers+text",
@@ -306,31 +413,29 @@ def upload():
         title="Target vs Achievement %", xaxis_title="Target (mn)",
         yaxis_title="Achiev %"
     )
-    dash_divs.append(plot_div(fig5))
+    dash_figs.append(plot_json(fig5))
     # 6. Employee performance bar
-    emp_df = pd.DataFrame(emp_rows).dropna(subset=["Target"])
-    emp_df = emp_df.sort_values("Sales Achiev %", ascending=False).head(12)  # top-12
+    emp_df = emp_rows_df.sort_values("Sales Achiev %", ascending=False).head(12)  # top-12
     fig6 = go.Figure([
-        go.Bar(name="Achieved",  x=emp_df["Name"], y=emp_df["Sales Total (mn)"],
+        go.Bar(name="Achieved",  x=emp_df["Employee Responsible"], y=emp_df["Sales Total (mn)"],
                marker_color=SE_GREEN),
-        go.Bar(name="Remaining", x=emp_df["Name"], y=emp_df["Sales Remaining"],
+        go.Bar(name="Remaining", x=emp_df["Employee Responsible"], y=emp_df["Sales Remaining"],
                marker_color=LIGHT_GRN)
     ])
     dark_template(fig6).update_layout(
         barmode="stack", title="Top Employee Performance (mn)",
         xaxis_tickangle=-25, legend_title_text=""
     )
-    dash_divs.append(plot_div(fig6))
+    dash_figs.append(plot_json(fig6))
     # ───────────────────────────────────────────────────────────────
     # PIVOT-1  (Helios × Cluster | Employee)
     # ───────────────────────────────────────────────────────────────
     # Only sales data for pivot-1
     pivot1 = (
-        df_sales.pivot_table(
-            index="Helios Code",
-            columns=["Cluster", "Employee Responsible"],
-            values=sales_col, aggfunc="sum", fill_value=0
-        )
+        df_sales.groupby(["Helios Code", "Cluster", "Employee Responsible"], observed=True)[sales_col]
+        .sum()
+        .unstack(["Cluster", "Employee Responsible"], fill_value=0)
+        .sort_index(axis=1)
     )
     total_row = pivot1.sum(numeric_only=True).to_frame().T
     total_row.index = ["Total"]
@@ -338,38 +443,48 @@ def upload():
     pivot1.index.name = "Helios Code"
     pivot1.columns = [f"{cl} | {emp}" for cl, emp in pivot1.columns]
     pivot1 = pivot1.reset_index()
-    numeric_cols = pivot1.columns.drop('Helios Code')
-    format_dict = {col: '{:,.2f}' for col in numeric_cols}
-    pivot1_html = pivot1.style.format(format_dict, na_rep="0").to_html(
-        classes=TABLE_CLASS, index=False, border=0
+    # uniform number format, no per-cell styling → plain to_html, not Styler
+    pivot1_html = pivot1.to_html(
+        classes=TABLE_CLASS, index=False, border=0, na_rep="0",
+        float_format="{:,.2f}".format
     )
     return render_template(
         "result.html",
-        graphs=dash_divs,
+        graphs=dash_figs,
+        plotly_js_url=PLOTLY_JS_URL,
+        plotly_config=PLOTLY_CONFIG,
         table2=pivot2_html,
         bu_table=bu_table_html,
         table1=pivot1_html
     )
 
 # --------------------- template generator --------------------------
+_template_cache = OrderedDict()      # blake2b(upload) → template .xlsx bytes
+_template_lock = threading.Lock()
+
+def build_target_template(stream):
+    df = read_sheet(stream)
+    df.columns = df.columns.str.strip()
+    employees = sorted(df["Employee Responsible"].dropna().unique())
+    emp_df = pd.DataFrame({"Employee Responsible": employees, "Target": [None]*len(employees)})
+    bu_df  = pd.DataFrame({"BU": ["PP","H&D","IND","SP","PS","DE"], "Target": [None]*6})
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as xw:
+        emp_df.to_excel(xw, sheet_name="Employee Targets", index=False)
+        bu_df.to_excel(xw, sheet_name="BU Targets", index=False)
+    return buf.getvalue()
+
 @app.route("/generate_target_template", methods=["POST"])
 def generate_target_template():
     file = request.files.get("file")
     if not file: return "⚠️ No file selected.", 400
     try:
-        df = pd.read_excel(io.BytesIO(file.read()), sheet_name=0)
+        xlsx = lru_lookup(_template_cache, _template_lock, stream_digest(file.stream),
+                          lambda: build_target_template(file.stream), TEMPLATE_CACHE_SIZE)
     except Exception as exc:
         return f"⚠️ Could not read Excel – {exc}", 400
-    df.columns = df.columns.str.strip()
-    employees = sorted(df["Employee Responsible"].dropna().unique())
-    emp_df = pd.DataFrame({"Employee Responsible": employees, "Target": [None]*len(employees)})
-    bu_df  = pd.DataFrame({"BU": ["PP","H&D","IND","SP","PS","DE"], "Target": [None]*6})
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        with pd.ExcelWriter(tmp.name) as xw:
-            emp_df.to_excel(xw, "Employee Targets", index=False)
-            bu_df.to_excel(xw, "BU Targets", index=False)
-        tmp.seek(0)
-        return send_file(tmp.name, as_attachment=True, download_name="target_template.xlsx")
+    return send_file(io.BytesIO(xlsx), as_attachment=True,
+                     download_name="target_template.xlsx", mimetype=XLSX_MIME)
 
 # ───────────────────────────────────────────────────────────────────
 if __name__ == "__main__":